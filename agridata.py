@@ -1,38 +1,69 @@
-import requests
 import pandas as pd
 import json
 import os
 import urllib3
 from datetime import datetime, timedelta
 
+import transport
+
 # 關閉 SSL 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def get_moa_agri_data(crop_code, crop_name="Unknown", days=365, force_update=False):
+def get_moa_agri_data(crop_code, crop_name="Unknown", days=365, force_update=False, raw=False):
     """
     通用版農產品抓取器
     參數:
     - crop_code: 作物代碼 (必填, e.g., "LA2", "LA1")
     - crop_name: 作物中文名 (選填, 用於顯示訊息)
     - days: 抓取天數
-    - force_update: 是否強制刷新 API
+    - force_update: 是否強制刷新 API (回放模式一律略過本地快取)
+    - raw: 回傳含成交量、未去重的原始 DataFrame (供資料品質檢查使用)
     """
     # 1. 自動生成檔名
     target_dir = "agridata"
     json_filename = f"agri_data_{crop_code}.json"
     json_file_path = os.path.join(target_dir, json_filename)
 
+    # 回放模式不讀寫本地快取：確實走過 MOA 抓取流程，也避免回放資料 (可能是其他日期區間) 污染快取
+    replaying = transport.get_transport().mode == 'replay'
+
     # 2. 檢查本地快取
-    if not force_update and os.path.exists(json_file_path):
+    if not force_update and not replaying and os.path.exists(json_file_path):
         print(f"[{crop_name}] 發現本地快取 '{json_file_path}'，直接讀取...")
         try:
             with open(json_file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            return process_agri_json(data)
+            return process_agri_json(data, raw=raw)
         except Exception as e:
             print(f"[{crop_name}] 讀取快取失敗，轉為 API 下載...")
 
-    # 3. 準備 API 請求
+    # 3. 呼叫 API
+    print(f"[{crop_name}] 正在呼叫 API... (Code: {crop_code})")
+    try:
+        data = fetch_moa_api(crop_code, days=days)
+
+        # 4. 存檔
+        if "Data" in data and len(data["Data"]) > 0:
+            if replaying:
+                print(f"[{crop_name}] 回放成功 (不寫入本地快取)")
+            else:
+                print(f"[{crop_name}] 下載成功！存檔至 '{json_file_path}'")
+                with open(json_file_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
+            return process_agri_json(data, raw=raw)
+        else:
+            print(f"[{crop_name}] API 回傳無資料 (可能代碼錯誤或休市)")
+            return empty_result(raw)
+
+    except Exception as e:
+        print(f"[{crop_name}] API 請求失敗: {e}")
+        return empty_result(raw)
+
+def fetch_moa_api(crop_code, days=365):
+    """
+    直接呼叫農業部 API，回傳原始 JSON (不讀寫本地快取)
+    - 供常駐服務做增量更新使用，失敗時直接拋出例外
+    """
     base_url = "https://data.moa.gov.tw/api/v1/AgriProductsTransType/"
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
@@ -48,32 +79,22 @@ def get_moa_agri_data(crop_code, crop_name="Unknown", days=365, force_update=Fal
         "format": "json"
     }
 
-    print(f"[{crop_name}] 正在呼叫 API... (Code: {crop_code})")
-    try:
-        response = requests.get(base_url, params=params, verify=False)
-        response.raise_for_status()
-        data = response.json()
+    # 透過傳輸層呼叫 (live / record / replay)
+    response = transport.get_transport().get(base_url, params=params, verify=False)
+    response.raise_for_status()
+    return response.json()
 
-        # 4. 存檔
-        if "Data" in data and len(data["Data"]) > 0:
-            print(f"[{crop_name}] 下載成功！存檔至 '{json_file_path}'")
-            with open(json_file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
-            return process_agri_json(data)
-        else:
-            print(f"[{crop_name}] API 回傳無資料 (可能代碼錯誤或休市)")
-            return pd.Series(dtype='float64')
-
-    except Exception as e:
-        print(f"[{crop_name}] API 請求失敗: {e}")
-        return pd.Series(dtype='float64')
+def empty_result(raw=False):
+    if raw:
+        return pd.DataFrame(columns=['Price', 'Quantity'], index=pd.DatetimeIndex([], name='Date'))
+    return pd.Series(dtype='float64')
 
-def process_agri_json(data):
+def process_agri_json(data, raw=False):
     if "Data" in data and len(data["Data"]) > 0:
         df = pd.DataFrame(data["Data"])
         # 確保欄位存在
         if 'TransDate' not in df.columns or 'Avg_Price' not in df.columns:
-            return pd.Series(dtype='float64')
+            return empty_result(raw)
             
         clean_df = df[['TransDate', 'Avg_Price']].copy()
 
@@ -85,11 +106,17 @@ def process_agri_json(data):
 
         clean_df['Date'] = pd.to_datetime(clean_df['TransDate'].apply(roc_to_ad))
         clean_df['Price'] = pd.to_numeric(clean_df['Avg_Price'], errors='coerce')
+        if 'Trans_Quantity' in df.columns:
+            clean_df['Quantity'] = pd.to_numeric(df['Trans_Quantity'], errors='coerce')
+        else:
+            clean_df['Quantity'] = float('nan')
         
-        clean_df.dropna(inplace=True)
+        clean_df.dropna(subset=['Date', 'Price'], inplace=True)
         clean_df.set_index('Date', inplace=True)
         clean_df.sort_index(inplace=True)
         
+        if raw:
+            return clean_df[['Price', 'Quantity']]
         return clean_df['Price']
     
-    return pd.Series(dtype='float64')
+    return empty_result(raw)
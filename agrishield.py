@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 import yfinance as yf
+
+import quality
+import transport
 # import matplotlib.pyplot as plt # 若您後續需要繪圖功能可保留
 # import seaborn as sns
 
@@ -25,8 +28,11 @@ def get_financial_universe(start_date, end_date):
     print(f"正在下載金融指標 ({len(tickers_map)} 檔)...")
     try:
         tickers = list(tickers_map.keys())
-        # yfinance 下載
-        df = yf.download(tickers, start=start_date, end=end_date, progress=False)['Close']
+        # yfinance 下載 (經由傳輸層錄製 / 回放)
+        df = transport.get_transport().fetch_frame(
+            'yahoo:download',
+            {'tickers': ','.join(tickers), 'start': start_date, 'end': end_date},
+            lambda: yf.download(tickers, start=start_date, end=end_date, progress=False)['Close'])
         
         # 處理 column 名稱 (MultiIndex 問題)
         if isinstance(df.columns, pd.MultiIndex):
@@ -45,37 +51,55 @@ def get_financial_universe(start_date, end_date):
 # ---------------------------------------------------------
 # 2. 核心引擎：Macro-Agri Scanner
 # ---------------------------------------------------------
-def run_scanner(agri_series, finance_df, crop_name):
+def merge_panel(agri_series, finance_df, max_ffill_days=quality.MAX_FFILL_DAYS):
     """
-    計算單一作物的相關性報告
+    將單一作物價格與金融數據對齊成同一張表
+    - max_ffill_days: 金融數據最多沿用幾天 (避免長假期間帶入過期數值)
     """
     # 轉換 Series 為 DataFrame 方便合併
     agri_df = agri_series.to_frame(name='Price')
 
-    # 合併：Left Join (保留農產品日期)，並用 ffill 補齊金融數據 (處理週末/休市)
-    merged = agri_df.join(finance_df, how='left').fillna(method='ffill')
-    merged.dropna(inplace=True) # 刪除最前面的空值
-    merged.to_csv(f'merged/merged_data_{crop_name}.csv')
+    # 合併：保留農產品日期，並用有上限的 ffill 補齊金融數據 (處理週末/休市)
+    aligned = quality.capped_ffill(finance_df, agri_df.index, max_ffill_days)
+    merged = agri_df.copy()
+    merged[list(finance_df.columns)] = aligned.to_numpy()
+    merged.dropna(inplace=True) # 刪除最前面的空值與過期的補值
+    return merged
+
+def run_scanner(agri_series, finance_df, crop_name, save_merged=True):
+    """
+    計算單一作物的相關性報告
+    - save_merged: 是否將合併後的中間數據存到 merged/ (常駐服務可關閉)
+    """
+    merged = merge_panel(agri_series, finance_df)
+    if save_merged:
+        merged.to_csv(f'merged/merged_data_{crop_name}.csv')
 
 
     if len(merged) < 30:
         print(f"[{crop_name}] 有效交易日過少 ({len(merged)}天)，跳過分析")
         return pd.DataFrame()
 
+    return score_assets(merged, finance_df.columns, crop_name)
+
+def score_assets(merged, feature_cols, crop_name, lag_1w=5, lag_1m=20):
+    """
+    對合併表中每個金融資產計算同步 / 領先相關，回傳依相關強度排序的報告
+    - lag_1w / lag_1m: 「一週」與「一個月」對應的位移期數 (依解析度而異，None 表示不適用)
+    """
     results = []
     target_col = 'Price'
-    feature_cols = finance_df.columns
 
     for asset in feature_cols:
         # A. 同步相關 (T=0)
         corr_0 = merged[target_col].corr(merged[asset])
         
         # B. 領先相關 (T-1週, T-1月)
-        lag_1w = merged[target_col].corr(merged[asset].shift(5))
-        lag_1m = merged[target_col].corr(merged[asset].shift(20))
+        lag_1w_corr = merged[target_col].corr(merged[asset].shift(lag_1w)) if lag_1w else np.nan
+        lag_1m_corr = merged[target_col].corr(merged[asset].shift(lag_1m)) if lag_1m else np.nan
 
         # 找最強
-        candidates = [corr_0, lag_1w, lag_1m]
+        candidates = [corr_0, lag_1w_corr, lag_1m_corr]
         # 過濾掉 NaN
         candidates = [c for c in candidates if not np.isnan(c)]
         
@@ -84,7 +108,7 @@ def run_scanner(agri_series, finance_df, crop_name):
         best_corr = max(candidates, key=abs)
         
         if best_corr == corr_0: timing = "Synchronized"
-        elif best_corr == lag_1w: timing = "Leading (1 Week)"
+        elif best_corr == lag_1w_corr: timing = "Leading (1 Week)"
         else: timing = "Leading (1 Month)"
 
         results.append({
@@ -93,8 +117,8 @@ def run_scanner(agri_series, finance_df, crop_name):
             'Best_Correlation': round(best_corr, 4),
             'Timing': timing,
             'Sync_Corr': round(corr_0, 4),
-            'Lag_1W_Corr': round(lag_1w, 4),
-            'Lag_1M_Corr': round(lag_1m, 4)
+            'Lag_1W_Corr': round(lag_1w_corr, 4),
+            'Lag_1M_Corr': round(lag_1m_corr, 4)
         })
 
     if not results: return pd.DataFrame()
@@ -104,3 +128,143 @@ def run_scanner(agri_series, finance_df, crop_name):
     res_df = res_df.sort_values('Abs_Corr', ascending=False).drop(columns=['Abs_Corr'])
     
     return res_df
+
+# ---------------------------------------------------------
+# 3. 滯後曲線 (Lag Curve)
+# ---------------------------------------------------------
+def lag_curve(agri_series, finance_df, asset, max_lag=30):
+    """
+    計算單一作物與單一資產在 0 ~ max_lag 交易日滯後下的相關係數
+    """
+    if asset not in finance_df.columns:
+        return pd.DataFrame(columns=['Lag', 'Corr'])
+
+    # 與 run_scanner 使用同一份合併結果，確保 Lag 0/5/20 數值一致
+    merged = merge_panel(agri_series, finance_df)
+    if merged.empty:
+        return pd.DataFrame(columns=['Lag', 'Corr'])
+
+    price = merged['Price']
+    feature = merged[asset]
+    rows = [{'Lag': lag, 'Corr': round(price.corr(feature.shift(lag)), 4)}
+            for lag in range(max_lag + 1)]
+    return pd.DataFrame(rows)
+
+# ---------------------------------------------------------
+# 4. 多解析度掃描 (Daily / Weekly / Monthly)
+# ---------------------------------------------------------
+# 各解析度設定：
+# - period: 週期 (週以週日結束，讓農產品週末交易日與同週的交易所日期同組)
+# - lag_1w / lag_1m: 「一週」「一個月」對應的位移期數
+# - min_obs: 最少有效期數
+RESOLUTIONS = {
+    'D': {'period': None, 'lag_1w': 5, 'lag_1m': 20, 'min_obs': 30},
+    'W': {'period': 'W-SUN', 'lag_1w': 1, 'lag_1m': 4, 'min_obs': 20},
+    'M': {'period': 'M', 'lag_1w': None, 'lag_1m': 1, 'min_obs': 12},
+}
+
+class SeriesAggregate:
+    """
+    單一序列的累積彙總 (每條序列只算一次)
+    - 任意週期的平均價 = 累積和在週期邊界相減 / 期間交易日數
+    - 週期收盤價 = 週期結束前最後一筆觀測 (依該序列自己的交易日曆)
+    """
+
+    def __init__(self, series):
+        s = series.dropna().sort_index()
+        self.dates = s.index.values.astype('datetime64[ns]')
+        self.values = s.to_numpy(dtype='float64')
+        self.csum = np.concatenate([[0.0], np.cumsum(self.values)])
+
+    def _bounds(self, starts, ends):
+        lo = np.searchsorted(self.dates, starts, side='left')
+        hi = np.searchsorted(self.dates, ends, side='right')
+        return lo, hi
+
+    def mean(self, starts, ends):
+        lo, hi = self._bounds(starts, ends)
+        n = hi - lo
+        total = self.csum[hi] - self.csum[lo]
+        out = np.full(len(n), np.nan)
+        np.divide(total, n, out=out, where=n > 0)
+        return out
+
+    def last(self, starts, ends):
+        # 該週期內完全沒有交易 (例如長假) 時回傳 NaN，不把上一期數值帶過來
+        lo, hi = self._bounds(starts, ends)
+        out = np.full(len(hi), np.nan)
+        has_obs = hi > lo
+        out[has_obs] = self.values[hi[has_obs] - 1]
+        return out
+
+def build_aggregates(agri_dataset, finance_df):
+    """
+    為所有作物與金融資產預先建立累積彙總
+    """
+    agri_aggs = {name: SeriesAggregate(series) for name, series in agri_dataset.items()}
+    fin_aggs = {col: SeriesAggregate(finance_df[col]) for col in finance_df.columns}
+    return agri_aggs, fin_aggs
+
+def resample_panels(agri_aggs, fin_aggs, period):
+    """
+    由累積彙總產生同一週期格線上的面板
+    - 農產品：週期內平均價 (依 MOA 交易日)
+    - 金融：週期內最後收盤 (依各交易所交易日)
+    """
+    all_dates = [agg.dates for agg in list(agri_aggs.values()) + list(fin_aggs.values()) if len(agg.dates)]
+    if not all_dates:
+        return pd.DataFrame(), pd.DataFrame()
+
+    lo = min(d[0] for d in all_dates)
+    hi = max(d[-1] for d in all_dates)
+    periods = pd.period_range(pd.Timestamp(lo), pd.Timestamp(hi), freq=period)
+    starts = periods.start_time.values
+    ends = periods.end_time.values
+    index = periods.end_time.normalize()
+
+    agri_panel = pd.DataFrame({name: agg.mean(starts, ends) for name, agg in agri_aggs.items()}, index=index)
+    fin_panel = pd.DataFrame({col: agg.last(starts, ends) for col, agg in fin_aggs.items()}, index=index)
+    return agri_panel, fin_panel
+
+def run_multi_resolution_scanner(agri_dataset, finance_df, resolutions=('D', 'W', 'M'), save_merged=False):
+    """
+    以多種解析度掃描所有作物，回傳附帶 Resolution 欄位的合併報告
+    - D: 沿用 run_scanner 的日資料邏輯
+    - W / M: 由預先計算的累積彙總直接取得週 / 月面板，不對每組配對重複 resample
+    """
+    reports = []
+    aggs = None
+
+    for res in resolutions:
+        if res not in RESOLUTIONS:
+            raise ValueError(f"不支援的解析度: {res} (可用: {', '.join(RESOLUTIONS)})")
+        cfg = RESOLUTIONS[res]
+
+        if cfg['period'] is None:
+            for crop_name, series in agri_dataset.items():
+                report = run_scanner(series, finance_df, crop_name, save_merged=save_merged)
+                if not report.empty:
+                    reports.append(report.assign(Resolution=res))
+            continue
+
+        if aggs is None:
+            aggs = build_aggregates(agri_dataset, finance_df)
+        agri_panel, fin_panel = resample_panels(*aggs, cfg['period'])
+        if fin_panel.empty:
+            continue
+
+        for crop_name in agri_dataset:
+            # 週期格線連續，shift(n) 即為前 n 個日曆週 / 月；缺值由 corr 逐對排除
+            merged = fin_panel.assign(Price=agri_panel[crop_name])
+            n_obs = merged['Price'].notna().sum()
+            if n_obs < cfg['min_obs']:
+                print(f"[{crop_name}] ({res}) 有效期數過少 ({n_obs}期)，跳過分析")
+                continue
+
+            report = score_assets(merged, fin_panel.columns, crop_name,
+                                  lag_1w=cfg['lag_1w'], lag_1m=cfg['lag_1m'])
+            if not report.empty:
+                reports.append(report.assign(Resolution=res))
+
+    if not reports: return pd.DataFrame()
+    return pd.concat(reports, ignore_index=True)
@@ -1,17 +1,18 @@
-import requests
 import pandas as pd
 import json
 import os
 import urllib3
 from datetime import datetime, timedelta
 
+import transport
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # API 基礎 URL
 base_url = "https://data.moa.gov.tw/api/v1/AgriProductsTransType/?Start_time=107.07.01&End_time=107.07.10&MarketName=%E5%8F%B0%E5%8C%97%E4%B8%80"
 
 # 從 API 取得資料
-response = requests.get(base_url, verify=False)
+response = transport.get_transport().get(base_url, verify=False)
 data = response.json()
 
 # 提取並轉換資料
@@ -0,0 +1,79 @@
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+# 引入我們拆分好的模組
+import agridata
+import agrishield
+import transport
+
+# ---------------------------------------------------------
+# 抓取階段錄製 / 離線壓測
+# ---------------------------------------------------------
+# 錄製 (需要網路)：python bench_fetch.py --mode record
+# 回放 (離線)：    python bench_fetch.py --latency 0.05 --error-rate 0.1 --min-throughput 50
+#
+# 直接呼叫 API 層 (不經本地 agridata/ 快取)，量測的是純抓取 + 解析的吞吐量
+
+def run_fetch_stage(target_crops, days):
+    ok, failed = 0, 0
+    min_date = datetime.now()
+    for crop in target_crops:
+        try:
+            series = agridata.process_agri_json(agridata.fetch_moa_api(crop["code"], days=days))
+        except Exception as e:
+            print(f"[{crop['name']}] 抓取失敗: {e}")
+            failed += 1
+            continue
+        ok += 1
+        if not series.empty and series.index.min() < min_date:
+            min_date = series.index.min()
+
+    end_str = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+    finance_df = agrishield.get_financial_universe(min_date.strftime('%Y-%m-%d'), end_str)
+    return ok, failed, finance_df
+
+def main():
+    parser = argparse.ArgumentParser(description="AgriShield 抓取階段錄製 / 離線壓測")
+    parser.add_argument('--mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--archive', default='http_archive.json.gz')
+    parser.add_argument('--crops', default='target_crops.json', help='作物清單 JSON')
+    parser.add_argument('--days', type=int, default=365*2)
+    parser.add_argument('--latency', type=float, default=0.0, help='回放延遲 (秒)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='回放延遲隨機增量上限 (秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='回放注入錯誤機率')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='回放重複次數')
+    parser.add_argument('--min-throughput', type=float, default=None,
+                        help='作物/秒 低於此值時以非零狀態結束 (回歸測試用)')
+    args = parser.parse_args()
+
+    with open(args.crops, "r", encoding="utf-8") as f:
+        target_crops = json.load(f)
+
+    t = transport.configure(mode=args.mode, archive_path=args.archive, latency=args.latency,
+                            jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+
+    repeat = 1 if args.mode == 'record' else args.repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        ok, failed, finance_df = run_fetch_stage(target_crops, args.days)
+    elapsed = time.perf_counter() - t0
+    t.save()
+
+    throughput = len(target_crops) * repeat / elapsed if elapsed else float('inf')
+    print("\n" + "="*60)
+    print(t.summary())
+    print(f"作物: 成功 {ok} / 失敗 {failed}，金融資產 {len(finance_df.columns)} 檔")
+    print(f"抓取階段: {elapsed:.2f}s，{throughput:.1f} 作物/秒 (重複 {repeat} 次)")
+    print("="*60)
+
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        print(f"吞吐量低於門檻 {args.min_throughput} 作物/秒")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
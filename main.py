@@ -1,12 +1,21 @@
 import json
+import sys
+import time
 import pandas as pd
 from datetime import datetime
 
 # 引入我們拆分好的模組
 import agridata
 import agrishield
+import quality
+
+def main(resolutions=('D',)):
+    # === 0. 檢查解析度參數 (在下載資料前先擋掉打錯的參數) ===
+    invalid = [r for r in resolutions if r not in agrishield.RESOLUTIONS]
+    if invalid:
+        print(f"錯誤：不支援的解析度 {', '.join(invalid)} (可用: {', '.join(agrishield.RESOLUTIONS)})")
+        return
 
-def main():
     # === A. 讀取作物清單 ===
     json_path = "target_crops.json"
     try:
@@ -18,24 +27,44 @@ def main():
         return
 
     # === B. 抓取所有農產品資料 ===
-    agri_dataset = {}
-    min_date = datetime.now()
+    raw_frames = {}
 
     print("\n=== Step 1: 啟動農產品數據下載引擎 (agridata) ===")
+    t0 = time.perf_counter()
     for crop in target_crops:
-        # 使用 agridata 模組中的函數
-        series = agridata.get_moa_agri_data(crop["code"], crop["name"], days=365*2)
+        # 使用 agridata 模組中的函數 (保留成交量與重複列，交給品質檢查處理)
+        frame = agridata.get_moa_agri_data(crop["code"], crop["name"], days=365*2, raw=True)
         
-        if not series.empty:
-            agri_dataset[crop["name"]] = series
-            # 記錄最早日期，為了抓金融數據用
-            if series.index.min() < min_date:
-                min_date = series.index.min()
+        if not frame.empty:
+            raw_frames[crop["name"]] = frame
+    load_sec = time.perf_counter() - t0
     
-    if not agri_dataset:
+    if not raw_frames:
         print("錯誤：沒有抓到任何農產品資料，程式終止。")
         return
 
+    # === B-2. 資料品質檢查 ===
+    print("\n=== Step 1.5: 資料品質檢查 (quality) ===")
+    t0 = time.perf_counter()
+    agri_dataset, quality_df = quality.clean_agri_dataset(raw_frames)
+    clean_sec = time.perf_counter() - t0
+
+    quality_filename = f"Full_report/AgriShield_Quality_Report_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    quality_df.to_csv(quality_filename, index=False)
+    dropped = quality_df.loc[~quality_df['Passed'], 'Crop'].tolist()
+    print(f"通過 {len(agri_dataset)} / {len(raw_frames)} 個作物 (清洗 {clean_sec:.2f}s，載入 {load_sec:.2f}s)")
+    print(f"標記異常值 {quality_df['Outliers'].sum()} 筆 (保留於序列)，重複 {quality_df['Duplicate_Rows'].sum()} 筆，"
+          f"無效 {quality_df['Invalid_Rows'].sum()} 筆，摘要已儲存至: {quality_filename}")
+    if dropped:
+        print(f"覆蓋率不足而略過: {', '.join(dropped)}")
+    
+    if not agri_dataset:
+        print("錯誤：沒有作物通過資料品質檢查，程式終止。")
+        return
+
+    # 記錄最早日期，為了抓金融數據用
+    min_date = min(series.index.min() for series in agri_dataset.values())
+
     # === C. 抓取金融資料 ===
     print("\n=== Step 2: 下載全球金融數據 (agrishield) ===")
     start_str = min_date.strftime('%Y-%m-%d')
@@ -52,15 +81,28 @@ def main():
     print("\n=== Step 3: 執行 Macro-Agri 相關性掃描 ===")
     all_reports = []
 
-    for crop_name, series in agri_dataset.items():
-        print(f"正在分析: {crop_name}...")
-        # 使用 agrishield 模組中的函數
-        report = agrishield.run_scanner(series, finance_df, crop_name)
-        
+    if tuple(resolutions) == ('D',):
+        for crop_name, series in agri_dataset.items():
+            print(f"正在分析: {crop_name}...")
+            # 使用 agrishield 模組中的函數
+            report = agrishield.run_scanner(series, finance_df, crop_name)
+            
+            if not report.empty:
+                all_reports.append(report)
+                top = report.iloc[0]
+                print(f" -> 發現最佳指標: {top['Asset']} (Corr: {top['Best_Correlation']}, {top['Timing']})")
+    else:
+        # 多解析度：週 / 月面板由累積彙總一次產生
+        print(f"解析度: {', '.join(resolutions)}")
+        report = agrishield.run_multi_resolution_scanner(agri_dataset, finance_df, resolutions, save_merged=True)
         if not report.empty:
             all_reports.append(report)
-            top = report.iloc[0]
-            print(f" -> 發現最佳指標: {top['Asset']} (Corr: {top['Best_Correlation']}, {top['Timing']})")
+            # 每個作物的報告已依相關強度排序，取每組第一列即為最佳指標
+            tops = report.groupby(['Resolution', 'Crop'], sort=False).head(1)
+            for res, group in tops.groupby('Resolution', sort=False):
+                print(f"\n[解析度 {res}]")
+                for _, top in group.iterrows():
+                    print(f" -> {top['Crop']} 發現最佳指標: {top['Asset']} (Corr: {top['Best_Correlation']}, {top['Timing']})")
 
     # === E. 總結報告存檔 ===
     if all_reports:
@@ -83,4 +125,5 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    # 例：python main.py D W M  (預設只跑日資料)
+    main(tuple(sys.argv[1:]) or ('D',))
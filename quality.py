@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# 資料品質檢查 (Data Quality Stage)
+# ---------------------------------------------------------
+# 所有作物合併成一張長表後一次處理 (bincount / reduceat / rolling)，不逐作物迴圈
+OUTLIER_WINDOW = 15         # 滾動中位數視窗 (交易日)
+OUTLIER_K = 5.0             # 偏離幾倍 MAD 視為異常
+OUTLIER_MIN_SCALE = 0.10    # MAD 的最小尺度 (中位數比例)，避免平穩序列把正常漲跌當成異常
+DROP_OUTLIERS = False       # 預設只標記異常值 (計入摘要)，不自序列刪除
+MAX_GAP_DAYS = 14           # 超過幾天無交易視為資料缺口
+MAX_FFILL_DAYS = 7          # 金融數據 ffill 最多沿用幾天
+MIN_OBS = 30                # 最少有效交易日 (與 run_scanner 門檻一致)
+MIN_COVERAGE = 0.3          # 有效交易日 / 期間日曆天數 的最低比例
+
+def clean_agri_dataset(raw_frames, window=OUTLIER_WINDOW, k=OUTLIER_K, min_scale=OUTLIER_MIN_SCALE,
+                       drop_outliers=DROP_OUTLIERS, max_gap_days=MAX_GAP_DAYS,
+                       min_obs=MIN_OBS, min_coverage=MIN_COVERAGE):
+    """
+    清洗所有作物的原始交易資料
+    參數:
+    - raw_frames: {作物名稱: DataFrame(index=Date, columns=[Price, Quantity])}
+      (agridata.get_moa_agri_data(..., raw=True) 的輸出)
+    - drop_outliers: 是否刪除異常值 (預設只標記，數量與最大偏離記在摘要)
+    回傳:
+    - agri_dataset: {作物名稱: 清洗後價格 Series} (只包含通過覆蓋率門檻的作物)
+    - summary: 每個作物一列的品質摘要
+    """
+    frames = {name: df for name, df in raw_frames.items() if not df.empty}
+    if not frames:
+        return {}, pd.DataFrame()
+
+    # 攤平成長表：Crop 以類別代碼 (輸入順序) 表示，之後的分組統計都直接用代碼，不重複 factorize
+    names = list(frames)
+    n = len(names)
+    codes = np.repeat(np.arange(n), [len(f) for f in frames.values()])
+    dates = np.concatenate([f.index.values.astype('datetime64[ns]') for f in frames.values()])
+    price = np.concatenate([f['Price'].to_numpy(dtype='float64') for f in frames.values()])
+    qty = np.concatenate([f['Quantity'].to_numpy(dtype='float64') for f in frames.values()])
+
+    order = np.lexsort((dates, codes))
+    codes, dates, price, qty = codes[order], dates[order], price[order], qty[order]
+    raw_rows = np.bincount(codes, minlength=n)
+
+    # A. 無效資料：價格非正值或成交量為 0 (成交量缺漏時保留)
+    invalid = (price <= 0) | (qty <= 0)
+    invalid_rows = np.bincount(codes[invalid], minlength=n)
+    codes, dates, price, qty = codes[~invalid], dates[~invalid], price[~invalid], qty[~invalid]
+
+    # B. 同日重複：以成交量加權平均價合併 (無成交量時取簡單平均)
+    starts = _block_starts(codes, dates)
+    rows = np.diff(np.r_[starts, len(codes)])
+    known = ~np.isnan(qty)
+    q_sum = _reduceat(np.add, np.where(known, qty, 0.0), starts)
+    pxq_sum = _reduceat(np.add, np.where(known, price * qty, 0.0), starts)
+    mean = _reduceat(np.add, price, starts) / np.maximum(rows, 1)
+    price = np.where(q_sum > 0, pxq_sum / np.where(q_sum > 0, q_sum, 1.0), mean)
+    codes, dates = codes[starts], dates[starts]
+    duplicate_rows = np.bincount(codes, weights=rows - 1, minlength=n).astype(int)
+
+    # C. 異常值：滾動中位數 / MAD (尺度至少為中位數的 min_scale，預設即偏離 50% 以上才標記)
+    median = _rolling_median(price, codes, window)
+    abs_dev = np.abs(price - median)
+    mad = _rolling_median(abs_dev, codes, window)
+    scale = np.maximum(1.4826 * mad, min_scale * median)
+    outlier = abs_dev > k * scale
+    outliers = np.bincount(codes[outlier], minlength=n)
+    max_dev = np.full(n, np.nan)
+    np.fmax.at(max_dev, codes[outlier], abs_dev[outlier] / median[outlier])
+    if drop_outliers:
+        codes, dates, price = codes[~outlier], dates[~outlier], price[~outlier]
+
+    # D. 缺口：相鄰交易日間隔 (每個作物第一筆為 NaN)
+    crop_starts = _block_starts(codes)
+    present = codes[crop_starts]
+    gap = np.full(len(dates), np.nan)
+    gap[1:] = (dates[1:] - dates[:-1]) / np.timedelta64(1, 'D')
+    gap[crop_starts] = np.nan
+    clean_rows = np.bincount(codes, minlength=n)
+    gaps = np.bincount(codes[gap > max_gap_days], minlength=n)
+    max_gap = np.full(n, np.nan)
+    max_gap[present] = _reduceat(np.fmax, gap, crop_starts)
+    first_date = np.full(n, np.datetime64('NaT', 'ns'))
+    last_date = np.full(n, np.datetime64('NaT', 'ns'))
+    first_date[present] = dates[crop_starts]
+    if len(present):
+        last_date[present] = dates[np.r_[crop_starts[1:], len(dates)] - 1]
+
+    # E. 覆蓋率
+    span_days = (last_date - first_date) / np.timedelta64(1, 'D') + 1
+    coverage = np.round(clean_rows / span_days, 3)
+    passed = (clean_rows >= min_obs) & (coverage >= min_coverage)
+
+    summary = pd.DataFrame({
+        'Crop': names,
+        'Raw_Rows': raw_rows,
+        'Invalid_Rows': invalid_rows,
+        'Duplicate_Rows': duplicate_rows,
+        'Outliers': outliers,
+        'Max_Outlier_Dev': np.round(max_dev, 3),
+        'Clean_Rows': clean_rows,
+        'First_Date': first_date,
+        'Last_Date': last_date,
+        'Gaps': gaps,
+        'Max_Gap_Days': max_gap,
+        'Coverage': coverage,
+        'Passed': passed,
+    })
+
+    # 已依作物排序，一次 np.split 切回各作物序列 (維持輸入的作物順序)
+    bounds = crop_starts[1:]
+    agri_dataset = {
+        names[c]: pd.Series(p, index=pd.DatetimeIndex(d, name='Date'), name='Price')
+        for c, d, p in zip(present, np.split(dates, bounds), np.split(price, bounds))
+        if passed[c]
+    }
+    return agri_dataset, summary
+
+def _block_starts(codes, dates=None):
+    # 已排序陣列中每個 (作物[, 日期]) 區塊的起始位置
+    if len(codes) == 0:
+        return np.array([], dtype=int)
+    change = codes[1:] != codes[:-1]
+    if dates is not None:
+        change |= dates[1:] != dates[:-1]
+    return np.flatnonzero(np.r_[True, change])
+
+def _reduceat(ufunc, values, starts):
+    if len(starts) == 0:
+        return np.array([], dtype='float64')
+    return ufunc.reduceat(values, starts)
+
+def _rolling_median(values, codes, window):
+    # 各作物分開計算置中滾動中位數 (values 已依作物、日期排序)
+    rolled = pd.Series(values).groupby(codes, sort=True).rolling(window, center=True, min_periods=3).median()
+    return rolled.reset_index(level=0, drop=True).sort_index().to_numpy()
+
+def capped_ffill(frame, index, max_days=MAX_FFILL_DAYS):
+    """
+    將 frame 以 forward fill 對齊到 index
+    - 距離最後一筆真實觀測超過 max_days 的補值視為過期，改回 NaN
+    - max_days=None 時不設上限
+    """
+    if frame.empty:
+        return frame.reindex(index)
+
+    union = frame.index.union(index.unique())
+    full = frame.reindex(union)
+    filled = full.ffill()
+
+    if max_days is not None:
+        # 每個欄位「最後一筆真實觀測日期」的矩陣，同樣 ffill 後與當日相減
+        dates = union.values.astype('datetime64[ns]')[:, None]
+        seen = np.where(full.notna().to_numpy(), dates, np.datetime64('NaT', 'ns'))
+        last_seen = pd.DataFrame(seen, index=union, columns=frame.columns).ffill()
+        age = dates - last_seen.to_numpy(dtype='datetime64[ns]')
+        filled = filled.mask(age > np.timedelta64(max_days, 'D'))
+
+    return filled.reindex(index)
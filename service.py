@@ -0,0 +1,348 @@
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+# 引入我們拆分好的模組
+import agridata
+import agrishield
+import quality
+
+# 滯後曲線最多計算幾個交易日 (約一年)，避免單一請求佔住執行緒並塞滿快取
+MAX_LAG = 260
+
+# ---------------------------------------------------------
+# 1. 常駐記憶體面板 (Warm Panel Store)
+# ---------------------------------------------------------
+class PanelStore:
+    """
+    常駐記憶體中的農產品 / 金融面板
+    - 啟動時載入一次，之後只做增量更新
+    - 每條序列有自己的版本號，查詢結果依賴的版本變動時自動失效
+    """
+
+    def __init__(self, target_crops, days=365*2, refresh_days=14):
+        self.target_crops = target_crops
+        self.days = days
+        self.refresh_days = refresh_days
+
+        self.lock = threading.RLock()
+        self.raw = {}           # 作物名稱 -> 原始交易 DataFrame (含成交量)
+        self.agri = {}          # 作物名稱 -> 清洗後價格 Series
+        self.quality = pd.DataFrame()
+        self.codes = {}         # 作物名稱 -> 作物代碼
+        self.finance = pd.DataFrame()
+        self.versions = {}      # ('agri', 作物) / ('fin', 資產) -> 版本號
+        self.cache = {}         # 查詢 key -> (依賴版本, 結果)
+        self.last_refresh = None
+
+    # === 載入與更新 ===
+    def load(self):
+        print(f"[Service] 載入 {len(self.target_crops)} 個作物面板...")
+        for crop in self.target_crops:
+            frame = agridata.get_moa_agri_data(crop["code"], crop["name"], days=self.days, raw=True)
+            if frame.empty:
+                continue
+            self.raw[crop["name"]] = frame
+            self.codes[crop["name"]] = crop["code"]
+
+        agri_dataset, self.quality = quality.clean_agri_dataset(self.raw)
+        for name, series in agri_dataset.items():
+            self._set_agri(name, series)
+
+        min_date = min((s.index.min() for s in self.agri.values()), default=datetime.now())
+
+        print("[Service] 載入金融面板...")
+        start_str = min_date.strftime('%Y-%m-%d')
+        end_str = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        self._merge_finance(agrishield.get_financial_universe(start_str, end_str))
+        self.last_refresh = datetime.now()
+        print(f"[Service] 面板就緒：{len(self.agri)} 個作物，{len(self.finance.columns)} 檔金融資產")
+
+    def refresh(self):
+        """
+        增量更新：抓最近 refresh_days 天 (或自最後一筆資料以來的天數)，與記憶體中的序列合併
+        回傳有變動的序列清單
+        """
+        changed = []
+        updated = {}            # 原始資料有變動的作物 -> 新的原始 DataFrame
+        now = datetime.now()
+        for name, code in list(self.codes.items()):
+            # 本地快取可能早已過期，至少要抓到接上記憶體中最後一筆的天數，避免序列出現缺口
+            days = max(self.refresh_days, (now - self.raw[name].index.max()).days + 1)
+            try:
+                data = agridata.fetch_moa_api(code, days=days)
+            except Exception as e:
+                print(f"[Service] [{name}] 增量更新失敗: {e}")
+                continue
+            update = agridata.process_agri_json(data, raw=True)
+            if update.empty:
+                continue
+
+            # 以新抓到的日期覆蓋舊的原始資料
+            old = self.raw[name]
+            raw = pd.concat([old[~old.index.isin(update.index)], update]).sort_index()
+            if not raw.equals(old):
+                self.raw[name] = raw
+                updated[name] = raw
+
+        if updated:
+            changed.extend(self._reclean(updated))
+
+        start = now - timedelta(days=self.refresh_days)
+        if not self.finance.empty:
+            start = min(start, self.finance.index.max().to_pydatetime())
+        end = now + timedelta(days=1)
+        update = agrishield.get_financial_universe(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+        changed.extend(self._merge_finance(update))
+
+        self.last_refresh = datetime.now()
+        if changed:
+            print(f"[Service] 增量更新完成，{len(changed)} 條序列有變動")
+        return changed
+
+    def _reclean(self, updated):
+        """
+        對有變動的作物一次重跑品質檢查，更新品質摘要
+        - 不再通過檢查的作物從面板移除，並更新版本讓快取失效
+        """
+        cleaned, summary = quality.clean_agri_dataset(updated)
+        changed = []
+        with self.lock:
+            if not self.quality.empty:
+                order = self.quality['Crop']
+                kept = self.quality[~self.quality['Crop'].isin(summary['Crop'])]
+                self.quality = pd.concat([kept, summary]).set_index('Crop').reindex(order).reset_index()
+            else:
+                self.quality = summary
+
+            for name in updated:
+                if name in cleaned:
+                    if not cleaned[name].equals(self.agri.get(name)):
+                        self._set_agri(name, cleaned[name])
+                        changed.append(('agri', name))
+                elif name in self.agri:
+                    print(f"[Service] [{name}] 未通過資料品質檢查，自面板移除")
+                    del self.agri[name]
+                    self._bump(('agri', name))
+                    changed.append(('agri', name))
+        return changed
+
+    def _set_agri(self, name, series):
+        with self.lock:
+            self.agri[name] = series
+            self._bump(('agri', name))
+
+    def _merge_finance(self, update):
+        changed = []
+        if update is None or update.empty:
+            return changed
+        with self.lock:
+            merged = update.combine_first(self.finance) if not self.finance.empty else update
+            for col in merged.columns:
+                old = self.finance[col] if col in self.finance.columns else None
+                if old is None or not merged[col].equals(old.reindex(merged.index)):
+                    self._bump(('fin', col))
+                    changed.append(('fin', col))
+            self.finance = merged
+        return changed
+
+    def _bump(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    # === 查詢結果快取 ===
+    def _cached(self, key, deps, compute):
+        with self.lock:
+            stamp = tuple(self.versions.get(d, 0) for d in deps)
+            hit = self.cache.get(key)
+            if hit is not None and hit[0] == stamp:
+                return hit[1], True
+        result = compute()
+        with self.lock:
+            self.cache[key] = (stamp, result)
+        return result, False
+
+    def crop_names(self):
+        # 排程執行緒會增刪作物，迭代前先在鎖內取快照
+        with self.lock:
+            return list(self.agri)
+
+    def _fin_deps(self):
+        return [('fin', col) for col in self.finance.columns]
+
+    # === 查詢 ===
+    def scan(self, crop):
+        if crop not in self.agri:
+            raise KeyError(f"找不到作物: {crop}")
+
+        def compute():
+            with self.lock:
+                series, finance = self.agri[crop], self.finance
+            report = agrishield.run_scanner(series, finance, crop, save_merged=False)
+            return _records(report)
+
+        return self._cached(('scan', crop), [('agri', crop)] + self._fin_deps(), compute)
+
+    def top_k(self, asset, k=10):
+        if asset not in self.finance.columns:
+            raise KeyError(f"找不到金融資產: {asset}")
+        if k < 1:
+            raise ValueError("k 必須大於等於 1")
+
+        crops = self.crop_names()
+
+        def compute():
+            rows = []
+            for crop in crops:
+                try:
+                    report, _ = self.scan(crop)
+                except KeyError:
+                    # 計算期間被排程更新移出面板
+                    continue
+                rows.extend(r for r in report if r['Asset'] == asset)
+            rows.sort(key=lambda r: abs(r['Best_Correlation'] or 0), reverse=True)
+            return rows
+
+        deps = [('agri', crop) for crop in crops] + self._fin_deps()
+        rows, cached = self._cached(('topk', asset), deps, compute)
+        return rows[:k], cached
+
+    def lag(self, crop, asset, max_lag=30):
+        if crop not in self.agri:
+            raise KeyError(f"找不到作物: {crop}")
+        if asset not in self.finance.columns:
+            raise KeyError(f"找不到金融資產: {asset}")
+        if not 0 <= max_lag <= MAX_LAG:
+            raise ValueError(f"max_lag 必須介於 0 ~ {MAX_LAG}")
+
+        def compute():
+            with self.lock:
+                series, finance = self.agri[crop], self.finance
+            return _records(agrishield.lag_curve(series, finance, asset, max_lag=max_lag))
+
+        # lag_curve 與 run_scanner 共用同一份合併表 (dropna 依賴所有欄位)
+        deps = [('agri', crop)] + self._fin_deps()
+        return self._cached(('lag', crop, asset, max_lag), deps, compute)
+
+def _records(df):
+    # 透過 to_json 轉換，NaN 會變成 null (json.dumps 會輸出非法的 NaN)
+    if df.empty:
+        return []
+    return json.loads(df.to_json(orient='records', force_ascii=False, date_format='iso'))
+
+# ---------------------------------------------------------
+# 2. 排程增量更新 (Scheduler)
+# ---------------------------------------------------------
+def start_scheduler(store, interval):
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                store.refresh()
+            except Exception as e:
+                print(f"[Service] 排程更新錯誤: {e}")
+
+    threading.Thread(target=loop, name="panel-refresh", daemon=True).start()
+    return stop
+
+# ---------------------------------------------------------
+# 3. HTTP / JSON API
+# ---------------------------------------------------------
+def _param(q, name):
+    if not q.get(name):
+        raise ValueError(f"缺少參數: {name}")
+    return q[name]
+
+def make_handler(store):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            t0 = time.perf_counter()
+            try:
+                if url.path == '/health':
+                    body = {
+                        'crops': len(store.crop_names()),
+                        'assets': list(store.finance.columns),
+                        'last_refresh': store.last_refresh.isoformat() if store.last_refresh else None,
+                    }
+                elif url.path == '/quality':
+                    body = {'results': _records(store.quality)}
+                elif url.path == '/crops':
+                    body = {'crops': sorted(store.crop_names())}
+                elif url.path == '/scan':
+                    crop = _param(q, 'crop')
+                    result, cached = store.scan(crop)
+                    body = {'crop': crop, 'cached': cached, 'results': result}
+                elif url.path == '/topk':
+                    asset, k = _param(q, 'asset'), int(q.get('k', 10))
+                    result, cached = store.top_k(asset, k)
+                    body = {'asset': asset, 'k': k, 'cached': cached, 'results': result}
+                elif url.path == '/lag':
+                    crop, asset = _param(q, 'crop'), _param(q, 'asset')
+                    max_lag = int(q.get('max_lag', 30))
+                    result, cached = store.lag(crop, asset, max_lag)
+                    body = {'crop': crop, 'asset': asset, 'cached': cached, 'results': result}
+                else:
+                    return self._send(404, {'error': f"未知路徑: {url.path}"})
+            except KeyError as e:
+                # 查無作物 / 資產
+                return self._send(404, {'error': e.args[0]})
+            except ValueError as e:
+                # 缺少參數或參數格式錯誤
+                return self._send(400, {'error': str(e)})
+            except Exception as e:
+                # 其餘錯誤仍回傳 JSON，避免連線直接被關閉
+                print(f"[Service] 查詢錯誤 {self.path}: {e!r}")
+                return self._send(500, {'error': f"內部錯誤: {e}"})
+
+            body['elapsed_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+            self._send(200, body)
+
+        def _send(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, fmt, *args):
+            print(f"[Service] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="AgriShield 常駐掃描服務")
+    parser.add_argument('--crops', default='target_crops.json', help='作物清單 JSON')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--interval', type=int, default=3600, help='增量更新間隔 (秒)')
+    parser.add_argument('--days', type=int, default=365*2, help='初次載入天數')
+    args = parser.parse_args()
+
+    with open(args.crops, "r", encoding="utf-8") as f:
+        target_crops = json.load(f)
+
+    store = PanelStore(target_crops, days=args.days)
+    store.load()
+    start_scheduler(store, args.interval)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store))
+    print(f"[Service] 服務啟動於 http://{args.host}:{args.port}  (/scan /topk /lag /crops /quality /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[Service] 服務停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
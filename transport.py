@@ -0,0 +1,237 @@
+import atexit
+import gzip
+import io
+import json
+import os
+import random
+import threading
+import time
+from datetime import date
+from urllib.parse import urlencode
+
+import pandas as pd
+import requests
+
+# ---------------------------------------------------------
+# HTTP 傳輸層 (Record / Replay Transport)
+# ---------------------------------------------------------
+# 模式 (可由環境變數或 configure() 設定)：
+# - live:   直接連線 (預設)
+# - record: 直接連線，並將回應存入本地壓縮檔
+# - replay: 不連線，從本地壓縮檔回放，可注入延遲與錯誤
+MODES = ('live', 'record', 'replay')
+
+# 每次執行都會變動的參數 (查詢起訖日)，回放時找不到完全相同的請求就忽略它們再比對
+VOLATILE_PARAMS = {'Start_time', 'End_time', 'start', 'end'}
+
+class ReplayMissError(Exception):
+    """回放檔中找不到對應的請求"""
+
+class InjectedError(requests.exceptions.ConnectionError):
+    """回放模式下人為注入的連線錯誤"""
+
+class ReplayResponse:
+    """
+    回放用的簡易 Response，提供呼叫端用到的 requests.Response 介面
+    """
+
+    def __init__(self, url, status_code, text):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error (replay) for url: {self.url}", response=self)
+
+class Transport:
+    def __init__(self, mode='live', archive_path='http_archive.json.gz',
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        if mode not in MODES:
+            raise ValueError(f"不支援的傳輸模式: {mode} (可用: {', '.join(MODES)})")
+        self.mode = mode
+        self.archive_path = archive_path
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.entries = {}       # 完整 key -> 紀錄
+        self.loose = {}         # 忽略起訖日的 key -> 日期區間最長的完整 key
+        self.dirty = False
+        self.stats = {'requests': 0, 'bytes': 0, 'errors': 0, 'seconds': 0.0}
+
+        if mode == 'replay' or (mode == 'record' and os.path.exists(archive_path)):
+            self.load()
+        if mode == 'record':
+            # 程式結束時自動寫回，避免每筆請求都重寫整個壓縮檔
+            atexit.register(self.save)
+
+    # === 回放檔讀寫 ===
+    def load(self):
+        if not os.path.exists(self.archive_path):
+            raise FileNotFoundError(f"找不到回放檔: {self.archive_path}")
+        with gzip.open(self.archive_path, 'rt', encoding='utf-8') as f:
+            archive = json.load(f)
+        for key, entry in archive.get('entries', {}).items():
+            self._store(key, entry)
+        self.dirty = False
+
+    def save(self):
+        if self.mode != 'record' or not self.dirty:
+            return
+        with self.lock:
+            archive = {'version': 1, 'entries': self.entries}
+            folder = os.path.dirname(self.archive_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with gzip.open(self.archive_path, 'wt', encoding='utf-8') as f:
+                json.dump(archive, f, ensure_ascii=False, separators=(',', ':'))
+            self.dirty = False
+        print(f"[Transport] 已寫入 {len(self.entries)} 筆紀錄至 '{self.archive_path}'")
+
+    def _store(self, key, entry):
+        # 同一個寬鬆 key 只保留日期區間最長的紀錄，避免短區間的增量請求蓋掉完整載入
+        self.entries[key] = entry
+        current = self.loose.get(entry['loose'])
+        if current is None or current == key or entry.get('span', 0) >= self.entries[current].get('span', 0):
+            self.loose[entry['loose']] = key
+
+    # === 對外介面 ===
+    def get(self, url, params=None, **kwargs):
+        """
+        與 requests.get 相同的呼叫方式
+        """
+        key, loose, span = _request_keys('GET', url, params)
+        t0 = time.perf_counter()
+        try:
+            if self.mode == 'replay':
+                entry = self._replay(key, loose)
+                response = ReplayResponse(entry['url'], entry['status'], entry['body'])
+            else:
+                response = requests.get(url, params=params, **kwargs)
+                if self.mode == 'record':
+                    self._record(key, loose, span, {'url': response.url, 'status': response.status_code,
+                                                    'body': response.text})
+        except Exception:
+            self._count(t0, 0, error=True)
+            raise
+        self._count(t0, len(response.content))
+        return response
+
+    def fetch_frame(self, name, params, fetch_fn):
+        """
+        錄製 / 回放非 requests 呼叫所產生的 DataFrame (例如 yfinance)
+        - name + params 組成 key，fetch_fn 只在 live / record 模式下呼叫
+        """
+        key, loose, span = _request_keys('FRAME', name, params)
+        t0 = time.perf_counter()
+        try:
+            if self.mode == 'replay':
+                body = self._replay(key, loose)['body']
+                df = pd.read_csv(io.StringIO(body), index_col=0, parse_dates=True)
+            else:
+                df = fetch_fn()
+                if self.mode == 'record':
+                    body = df.to_csv()
+                    self._record(key, loose, span, {'url': name, 'status': 200, 'body': body})
+        except Exception:
+            self._count(t0, 0, error=True)
+            raise
+        # live 模式不序列化，以記憶體用量近似資料量
+        nbytes = len(body) if self.mode != 'live' else int(df.memory_usage().sum())
+        self._count(t0, nbytes)
+        return df
+
+    def summary(self):
+        s = self.stats
+        rate = s['requests'] / s['seconds'] if s['seconds'] else 0.0
+        mb = s['bytes'] / 1e6
+        return (f"[Transport] 模式={self.mode} 請求={s['requests']} 錯誤={s['errors']} "
+                f"資料量={mb:.2f}MB 耗時={s['seconds']:.2f}s ({rate:.1f} req/s)")
+
+    # === 內部 ===
+    def _replay(self, key, loose):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and loose in self.loose:
+                entry = self.entries[self.loose[loose]]
+            roll = self.rng.random()
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if entry is None:
+            raise ReplayMissError(f"回放檔中找不到請求: {key}")
+        if delay:
+            time.sleep(delay)
+        if roll < self.error_rate:
+            raise InjectedError(f"注入錯誤 (replay): {key}")
+        return entry
+
+    def _record(self, key, loose, span, entry):
+        entry['loose'] = loose
+        entry['span'] = span
+        with self.lock:
+            self._store(key, entry)
+            self.dirty = True
+
+    def _count(self, t0, nbytes, error=False):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += nbytes
+            self.stats['seconds'] += time.perf_counter() - t0
+            if error:
+                self.stats['errors'] += 1
+
+def _request_keys(method, url, params):
+    params = params or {}
+    items = sorted((k, str(v)) for k, v in params.items())
+    key = f"{method} {url}?{urlencode(items)}"
+    loose = f"{method} {url}?{urlencode([(k, v) for k, v in items if k not in VOLATILE_PARAMS])}"
+
+    # 請求的日期區間長度 (天)，無法解析時視為 0
+    dates = [_parse_date(v) for k, v in items if k in VOLATILE_PARAMS]
+    dates = [d for d in dates if d is not None]
+    span = (max(dates) - min(dates)).days if len(dates) == 2 else 0
+    return key, loose, span
+
+def _parse_date(value):
+    # 支援民國年 (114.12.03) 與西元年 (2025-12-03)
+    try:
+        if '.' in value:
+            y, m, d = value.split('.')
+            return date(int(y) + 1911, int(m), int(d))
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+# ---------------------------------------------------------
+# 全域傳輸實例
+# ---------------------------------------------------------
+_transport = None
+
+def configure(mode=None, archive_path=None, latency=None, jitter=None, error_rate=None, seed=None):
+    """
+    設定全域傳輸層，未指定的參數由環境變數取得：
+    AGRISHIELD_HTTP_MODE / AGRISHIELD_HTTP_ARCHIVE / AGRISHIELD_REPLAY_LATENCY /
+    AGRISHIELD_REPLAY_JITTER / AGRISHIELD_REPLAY_ERROR_RATE / AGRISHIELD_REPLAY_SEED
+    """
+    global _transport
+    env = os.environ.get
+    _transport = Transport(
+        mode=mode or env('AGRISHIELD_HTTP_MODE', 'live'),
+        archive_path=archive_path or env('AGRISHIELD_HTTP_ARCHIVE', 'http_archive.json.gz'),
+        latency=latency if latency is not None else float(env('AGRISHIELD_REPLAY_LATENCY', 0)),
+        jitter=jitter if jitter is not None else float(env('AGRISHIELD_REPLAY_JITTER', 0)),
+        error_rate=error_rate if error_rate is not None else float(env('AGRISHIELD_REPLAY_ERROR_RATE', 0)),
+        seed=seed if seed is not None else int(env('AGRISHIELD_REPLAY_SEED', 0)),
+    )
+    return _transport
+
+def get_transport():
+    if _transport is None:
+        configure()
+    return _transport